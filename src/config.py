@@ -8,6 +8,7 @@ INTERVAL_MINUTES = 1.00
 
 # Timing settings
 READ_INTERVAL_SECONDS = 1        # How often to check the depth (in seconds)
+IDLE_READ_INTERVAL_SECONDS = 5   # Slower check while depth sits well inside the idle band
 SEND_INTERVAL_MINUTES = INTERVAL_MINUTES  # Mirror existing setting for compatibility
 
 # Hardware configuration
@@ -16,6 +17,11 @@ RESISTOR_OHMS = 250              # Resistor value in ohms for mA conversion
 MAX_DEPTH_FT = 11.5              # Max measurable depth (based on sensor)
 
 DEPTH_SCALING_FACTOR = 1.0 # Reset for recalibration with sensor in air
+DEPTH_OVERSAMPLE_COUNT = 5   # ADC reads per depth sample (median rejects spikes)
+
+# ADS1115 I2C bus clock (fast mode). On the Pi the kernel driver sets the
+# actual rate: add dtparam=i2c_arm_baudrate=400000 to /boot/config.txt.
+I2C_FREQUENCY_HZ = 400000
 
 # Path to setpoints JSON file
 SETPOINTS_FILE = "/home/pi/setpoints.json"
@@ -1,9 +1,68 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 from src.config import LOG_DIR
 
+# Background thread that writes queued records to the real handlers
+_listener: QueueListener | None = None
+
+# Last emit time (monotonic) per logRateLimited key
+_rate_limit_last: dict[str, float] = {}
+
+# None of our formats use thread/process fields; skip collecting them per record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+
+class CachedTimeFormatter(logging.Formatter):
+    """
+    Formatter that renders asctime once per second instead of once per
+    record. Only valid for second-resolution datefmt strings.
+    """
+
+    _cached_second = None
+    _cached_time = ""
+
+    def formatTime(self, record, datefmt=None) -> str:
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_time = super().formatTime(record, datefmt)
+            self._cached_second = second
+        return self._cached_time
+
+
+class SizeCachedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that keeps a running byte count instead of
+    seeking to the end of the file on every record to decide on rollover.
+    """
+
+    _bytes = 0
+
+    def _open(self):
+        stream = super()._open()
+        try:
+            self._bytes = os.path.getsize(self.baseFilename)
+        except OSError:
+            self._bytes = 0
+        return stream
+
+    def shouldRollover(self, record) -> bool:
+        return self.maxBytes > 0 and self._bytes >= self.maxBytes
+
+    def format(self, record) -> str:
+        msg = super().format(record)
+        # Count encoded bytes: log lines contain non-ASCII text such as "→"
+        encoded = msg.encode(self.encoding or "utf-8", "replace")
+        self._bytes += len(encoded) + len(self.terminator)
+        return msg
+
 
 def setupLogging() -> None:
     """
@@ -12,13 +71,18 @@ def setupLogging() -> None:
     - Logs to LOG_DIR/controlpod_service.log (rotating file)
     - Logs to console (stdout)
     - INFO level by default
+
+    Records are queued by the calling thread and written by a
+    QueueListener thread, so the control loop never blocks on file I/O.
     """
+    global _listener
+
     log_dir = Path(LOG_DIR)
     log_dir.mkdir(parents=True, exist_ok=True)
 
     log_file = log_dir / "controlpod_service.log"
 
-    formatter = logging.Formatter(
+    formatter = CachedTimeFormatter(
         fmt="%(asctime)s - [%(levelname)s] - %(name)s - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
@@ -28,11 +92,13 @@ def setupLogging() -> None:
     # Clear any existing handlers so we don't duplicate logs
     if root.handlers:
         root.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
 
     root.setLevel(logging.INFO)
 
     # File handler (rotating)
-    file_handler = RotatingFileHandler(
+    file_handler = SizeCachedRotatingFileHandler(
         log_file,
         maxBytes=1_000_000,   # ~1 MB per file
         backupCount=3,        # keep a few old logs
@@ -43,6 +109,43 @@ def setupLogging() -> None:
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
 
-    root.addHandler(file_handler)
-    root.addHandler(console_handler)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stopLogging() -> None:
+    """Flush any queued records and stop the logging thread."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logRateLimited(
+    logger: logging.Logger,
+    key: str,
+    level: int,
+    msg: str,
+    *args,
+    period: float = 60.0,
+) -> None:
+    """
+    Log msg at most once every `period` seconds per key. Use for
+    per-tick status lines that would otherwise flood the SD card.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    now = time.monotonic()
+    last = _rate_limit_last.get(key)
+    if last is None or now - last >= period:
+        _rate_limit_last[key] = now
+        logger.log(level, msg, *args)
+
 
+atexit.register(stopLogging)
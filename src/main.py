@@ -13,9 +13,12 @@ Features:
 - Sends JSON telemetry payloads to ChirpStack at INTERVAL_MINUTES
 """
 
+import atexit
 import time
 import logging
-from datetime import datetime, timezone
+import queue
+import signal
+import threading
 
 from src import shared_state
 from src import logger
@@ -23,7 +26,9 @@ from src.config import (
     DEVICE_NAME,
     INTERVAL_MINUTES,
     READ_INTERVAL_SECONDS,
+    IDLE_READ_INTERVAL_SECONDS,
     ALARM_GPIO_PIN,
+    I2C_FREQUENCY_HZ,
     #HEARTBEAT_GPIO_PIN,
     PUMP_START_FEET,
     PUMP_STOP_FEET,
@@ -32,7 +37,7 @@ from src.config import (
     SITE_NAME,
 )
 from src.telemetry import read_depth
-from src.usb_settings import sync_usb_to_local, load_setpoints
+from src.usb_settings import sync_usb_to_local, load_setpoints, bulk_setpoints_update
 from src.downlink import process_downlink_command
 from src.control import is_override_active
 from src import rak as rak_service
@@ -57,19 +62,120 @@ rak = rak_service.connect()
 if rak is None:
     rak = DummyRAK()
 
+# Cap on downlinks applied per tick so a flood can't starve pump control
+MAX_DOWNLINKS_PER_TICK = 16
+
+# Set by SIGTERM/SIGINT/SIGHUP so the loop exits without waiting out a sleep
+_stop_event = threading.Event()
+
+
+def _request_stop(signum: int) -> None:
+    log.info("[MAIN] Received signal %d; stopping control loop.", signum)
+    _stop_event.set()
+
+
+def _handle_stop_signal(signum, frame) -> None:
+    # Runs on the main thread, which may be inside _stop_event.wait() holding
+    # the Event's (non-reentrant) lock; set it from another thread instead.
+    threading.Thread(target=_request_stop, args=(signum,), daemon=True).start()
+
+
+def _safe_shutdown() -> None:
+    """
+    Leave the pump OFF and the alarm light dark on any exit path
+    (normal stop, signal, or an uncaught exception), so a dead
+    controller never leaves the pump latched on.
+    """
+    try:
+        relay.turn_pump_off(force=True)
+    except Exception as e:
+        log.error("[PUMP] Shutdown: failed to force OFF: %s", e)
+    relay.set_alarm_light_hw(False, force=True)
+
+# ---------------------------------------------------------------------------
+# SETPOINT HELPERS
+# ---------------------------------------------------------------------------
+
+def _unpack_setpoints(setpoints: dict) -> tuple:
+    """
+    Return (start, stop, hi_alarm, lo_alarm, site_name, zero_offset),
+    falling back to the config defaults for missing keys.
+    """
+    return (
+        setpoints.get("START_PUMP_AT", PUMP_START_FEET),
+        setpoints.get("STOP_PUMP_AT", PUMP_STOP_FEET),
+        setpoints.get("HI_ALARM", HI_ALARM_FEET),
+        setpoints.get("LO_ALARM", LO_ALARM_FEET),
+        setpoints.get("SITE_NAME", SITE_NAME),
+        setpoints.get("ZERO_OFFSET", 0.0),
+    )
+
+# ---------------------------------------------------------------------------
+# TELEMETRY SEND WORKER
+# ---------------------------------------------------------------------------
+
+# Uplinks (and any reconnect/re-join) run on a worker thread so a slow
+# radio exchange never delays depth reads or pump decisions. A single
+# slot keeps at most one sample waiting behind the one being sent, so a
+# stuck radio can't build up a backlog of stale readings.
+_send_queue: queue.Queue = queue.Queue(maxsize=1)
+
+
+# Upper bound on the back-off between consecutive failed reconnects
+MAX_RECONNECT_BACKOFF_S = 300
+
+
+def _send_worker() -> None:
+    global rak
+
+    reconnect_failures = 0
+
+    while True:
+        telemetry = _send_queue.get()
+        try:
+            ok = rak_service.send_data_to_chirpstack(rak, telemetry)
+            if ok:
+                reconnect_failures = 0
+                continue
+
+            # Module still answering on the open port: re-join in place
+            # and retry on the next interval instead of reopening it.
+            if rak_service.check_health(rak) and rak_service.ensure_joined(rak):
+                log.warning("[MAIN] Send failed but RAK is responsive; retrying next interval.")
+                continue
+
+            if reconnect_failures:
+                backoff = min(MAX_RECONNECT_BACKOFF_S, 2 ** reconnect_failures)
+                log.warning("[MAIN] Waiting %d s before RAK reconnect attempt.", backoff)
+                if _stop_event.wait(backoff):
+                    return
+
+            log.warning("[MAIN] Send failed; attempting RAK reconnect.")
+            rak2 = rak_service.reconnect_rak(rak)
+            if rak2 is not None:
+                rak = rak2
+                reconnect_failures = 0
+            else:
+                reconnect_failures += 1
+        except Exception as e:
+            log.error("[MAIN] Telemetry send error: %s", e)
+
 # ---------------------------------------------------------------------------
 # MAIN CONTROL LOOP
 # ---------------------------------------------------------------------------
 
 def main() -> None:
-    global rak, analog_input_channel
+    global analog_input_channel
     print("Starting MCTL3 with RAK3172...")
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, _handle_stop_signal)
 
     # ----------------- GPIO -----------------
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BCM)
     GPIO.setup(ALARM_GPIO_PIN, GPIO.OUT)
     GPIO.output(ALARM_GPIO_PIN, GPIO.LOW)
+    atexit.register(_safe_shutdown)
 
     # Heartbeat LED setup
     # GPIO.setup(HEARTBEAT_GPIO_PIN, GPIO.OUT)
@@ -77,15 +183,15 @@ def main() -> None:
     
     # ----------------- ADS1115 -----------------
     try:
-        i2c = busio.I2C(board.SCL, board.SDA)
+        i2c = busio.I2C(board.SCL, board.SDA, frequency=I2C_FREQUENCY_HZ)
         ads = ADS.ADS1115(i2c)
         analog_input_channel = AnalogIn(ads, 0)  # single-ended channel 0
-        shared_state.analog_input_channel = AnalogIn(ads, 0)  # single-ended channel 0
+        shared_state.analog_input_channel = analog_input_channel
         log.info("ADS1115 detected on I2C bus.")
     except Exception as e:
         ads = None
         shared_state.analog_input_channel = None
-        log.error(f"[SIM] No ADS1115 detected ({e}); using simulated depth readings.")
+        log.error("[SIM] No ADS1115 detected (%s); using simulated depth readings.", e)
 
     # ----------------- Pump + alarms state -----------------
     pump_is_on = False
@@ -101,12 +207,12 @@ def main() -> None:
         else:
             log.info("[MAIN] USB setpoints already current.")
     except Exception as e:
-        log.error(f"[MAIN] USB sync failed: {e}")
+        log.error("[MAIN] USB sync failed: %s", e)
 
     try:
         current_setpoints = load_setpoints()
     except Exception as e:
-        log.error(f"[MAIN] Failed to load setpoints, using defaults: {e}")
+        log.error("[MAIN] Failed to load setpoints, using defaults: %s", e)
         current_setpoints = {
             "START_PUMP_AT": PUMP_START_FEET,
             "STOP_PUMP_AT": PUMP_STOP_FEET,
@@ -115,18 +221,29 @@ def main() -> None:
             "SITE_NAME": SITE_NAME,
         }
 
+    (start_depth, stop_depth, hi_alarm, lo_alarm,
+     site_name, zero_offset) = _unpack_setpoints(current_setpoints)
+
     # --------- DETERMINISTIC STARTUP PUMP STATE ----------
     log.info("[PUMP] Startup: forcing pump OFF for known safe state.")
     try:
-        relay.send_relay_command("relay off 0")
+        relay.turn_pump_off(force=True)
     except Exception as e:
-        log.error(f"[PUMP] Startup: failed to force OFF: {e}")
+        log.error("[PUMP] Startup: failed to force OFF: %s", e)
 
     pump_is_on = False
     log.info("[PUMP] Startup: pump_is_on set to False (deterministic).")
 
+    # --------- Telemetry sender ----------
+    threading.Thread(target=_send_worker, name="rak-send", daemon=True).start()
+
     # --------- Telemetry timer ----------
-    last_send_time = time.time()
+    # Monotonic clock so an NTP/RTC step can't stall or burst the uplinks
+    send_interval_s = INTERVAL_MINUTES * 60
+    next_send_time = time.monotonic() + send_interval_s
+
+    # Phase-locked tick so loop work doesn't stretch the sampling period
+    next_tick = time.monotonic()
 
     # =====================================================
     # MAIN LOOP
@@ -142,17 +259,17 @@ def main() -> None:
             mA = measurement.ma_clamped        # mA
             voltage = measurement.voltage      # volts
 
-            log.info(
-                f"[MEASURE] depth={depth:.2f} ft  mA={mA:.3f}  V={voltage:.3f}"
+            logger.logRateLimited(
+                log, "measure", logging.INFO,
+                "[MEASURE] depth=%.2f ft  mA=%.3f  V=%.3f", depth, mA, voltage,
             )
         except Exception as e:
-            log.error(f"[MAIN] Error reading depth: {e}")
+            log.error("[MAIN] Error reading depth: %s", e)
             depth, mA, voltage = 0.0, 0.0, 0.0
 
 
         # -------- APPLY ZERO OFFSET --------
         try:
-            zero_offset = current_setpoints.get("ZERO_OFFSET", 0.0)
             depth_raw = depth
 
             # Apply offset: user-defined shift in feet
@@ -161,35 +278,39 @@ def main() -> None:
             # Clamp so we never send negative depths into the unsigned field
             depth = max(0.0, adjusted)
 
-            log.info(
-                f"[ZERO] Applied zero_offset={zero_offset:.3f} → "
-                f"adjusted_depth={depth:.3f} (raw={depth_raw:.3f})"
+            logger.logRateLimited(
+                log, "zero", logging.INFO,
+                "[ZERO] Applied zero_offset=%.3f → adjusted_depth=%.3f (raw=%.3f)",
+                zero_offset, depth, depth_raw,
             )
         except Exception as e:
-            log.error(f"[ZERO] Failed to apply zero offset: {e}")
+            log.error("[ZERO] Failed to apply zero offset: %s", e)
 
 
         # ---------- Downlink ----------
         try:
-            downlink_command = rak.check_downlink()
-            if downlink_command:
-                log.info(f"[DOWNLINK] Received raw: {downlink_command}")
-                process_downlink_command(downlink_command)
-                # Reload setpoints after any downlink
+            # Apply every queued downlink, then reload setpoints once
+            # (setpoint files are fsynced once for the whole batch)
+            downlinks_applied = 0
+            with bulk_setpoints_update():
+                while downlinks_applied < MAX_DOWNLINKS_PER_TICK:
+                    downlink_command = rak.check_downlink()
+                    if not downlink_command:
+                        break
+                    log.info("[DOWNLINK] Received raw: %s", downlink_command)
+                    process_downlink_command(downlink_command)
+                    downlinks_applied += 1
+
+            if downlinks_applied:
                 try:
                     current_setpoints = load_setpoints()
-                    log.info(f"[SETPOINTS] Reloaded after downlink: {current_setpoints}")
+                    (start_depth, stop_depth, hi_alarm, lo_alarm,
+                     site_name, zero_offset) = _unpack_setpoints(current_setpoints)
+                    log.info("[SETPOINTS] Reloaded after downlink: %s", current_setpoints)
                 except Exception as e:
-                    log.error(f"[SETPOINTS] Failed to reload after downlink: {e}")
+                    log.error("[SETPOINTS] Failed to reload after downlink: %s", e)
         except Exception as e:
-            log.error(f"[MAIN] Downlink check error: {e}")
-
-        # ---------- Setpoints ----------
-        start_depth = current_setpoints.get("START_PUMP_AT", PUMP_START_FEET)
-        stop_depth  = current_setpoints.get("STOP_PUMP_AT", PUMP_STOP_FEET)
-        hi_alarm    = current_setpoints.get("HI_ALARM", HI_ALARM_FEET)
-        lo_alarm    = current_setpoints.get("LO_ALARM", LO_ALARM_FEET)
-        site_name   = current_setpoints.get("SITE_NAME", SITE_NAME)
+            log.error("[MAIN] Downlink check error: %s", e)
 
         # -----------------------------------------------------------------------
         # PUMP CONTROL (override first)
@@ -197,7 +318,7 @@ def main() -> None:
         override = is_override_active()
 
         if override:
-            log.info("[OVERRIDE] ACTIVE → Pump forced OFF.")
+            log.debug("[OVERRIDE] ACTIVE → Pump forced OFF.")
             if pump_is_on:
                 relay.turn_pump_off()
             pump_is_on = False
@@ -205,13 +326,13 @@ def main() -> None:
             # Normal automatic pump logic
             if pump_is_on and depth <= stop_depth:
                 log.info(
-                    f"[PUMP] depth={depth:.2f} <= STOP_PUMP_AT={stop_depth:.2f} → OFF"
+                    "[PUMP] depth=%.2f <= STOP_PUMP_AT=%.2f → OFF", depth, stop_depth
                 )
                 relay.turn_pump_off()
                 pump_is_on = False
             elif (not pump_is_on) and depth >= start_depth:
                 log.info(
-                    f"[PUMP] depth={depth:.2f} >= START_PUMP_AT={start_depth:.2f} → ON"
+                    "[PUMP] depth=%.2f >= START_PUMP_AT=%.2f → ON", depth, start_depth
                 )
                 relay.turn_pump_on()
                 pump_is_on = True
@@ -231,40 +352,66 @@ def main() -> None:
         alarm_lo_on = lo_alarm_tripped
 
         # ---------- Telemetry send ----------
-        if time.time() - last_send_time >= INTERVAL_MINUTES * 60:
+        now = time.monotonic()
+        if now >= next_send_time:
             telemetry = {
                 "device": DEVICE_NAME,
-                "ts": datetime.now(timezone.utc).isoformat(),
                 "depth": depth,
                 "current_mA": mA,
                 "voltage": voltage,
                 "start": start_depth,
                 "stop": stop_depth,
                 "pump_on": pump_is_on,
-                "override": is_override_active(),
+                "override": override,
                 "hi_alarm": alarm_hi_on,
                 "lo_alarm": alarm_lo_on,
                 "site_name": site_name,
             }
 
             try:
-                ok = rak_service.send_data_to_chirpstack(rak, telemetry)
-                if not ok:
-                    log.warning("[MAIN] Send failed; attempting RAK reconnect.")
-                    rak2 = rak_service.reconnect_rak(rak)
-                    if rak2 is not None:
-                        rak = rak2
-            except Exception as e:
-                log.error(f"[MAIN] Telemetry send error: {e}")
-
-            last_send_time = time.time()
+                _send_queue.put_nowait(telemetry)
+            except queue.Full:
+                log.warning("[SEND] Previous send still in flight; dropping telemetry sample.")
+
+            next_send_time += send_interval_s
+            if next_send_time <= now:
+                # Fell more than a full interval behind; don't burst catch-up sends
+                next_send_time = now + send_interval_s
         
         # ---------- Heartbeat blink ----------
         #heartbeat_state = not heartbeat_state
         #GPIO.output(HEARTBEAT_GPIO_PIN,
         #            GPIO.HIGH if heartbeat_state else GPIO.LOW)
         
-        time.sleep(READ_INTERVAL_SECONDS)
+        # ---------- Tick cadence ----------
+        # Back off while the pump is off, nothing is alarming and depth is
+        # comfortably between LO_ALARM and START_PUMP_AT.
+        margin = 0.1 * (start_depth - stop_depth)
+        idle = (
+            not pump_is_on
+            and not override
+            and not (alarm_hi_on or alarm_lo_on)
+            and lo_alarm + margin < depth < start_depth - margin
+        )
+        tick_base = next_tick
+        if idle:
+            # Still wake in time for a due uplink
+            next_tick = min(
+                tick_base + IDLE_READ_INTERVAL_SECONDS,
+                max(next_send_time, tick_base + READ_INTERVAL_SECONDS),
+            )
+        else:
+            next_tick = tick_base + READ_INTERVAL_SECONDS
+
+        slack = next_tick - time.monotonic()
+        if slack <= 0:
+            # Overran the tick; resync instead of spinning to catch up
+            next_tick = time.monotonic()
+            slack = 0
+        if _stop_event.wait(slack):
+            break
+
+    log.info("[MAIN] Control loop stopped.")
 
 
 if __name__ == "__main__":
@@ -1,6 +1,16 @@
+import queue
+import re
 import serial
 import time
-from typing import List, Optional, Union
+from collections import deque
+from typing import Deque, List, Optional, Union
+
+# Downlink URC, e.g. "+EVT:RX_1:-70:8:UNICAST:1:4869". Captures the final
+# field when it is whole bytes of hex.
+_RX1_RE = re.compile(r"\+EVT:RX_1:.*:((?:[0-9A-Fa-f]{2})+)\s*$")
+
+# Whitespace stripped from hex payload strings before validation
+_WS_TBL = str.maketrans("", "", " \t\r\n")
 
 
 class RAK3172Communicator:
@@ -10,14 +20,24 @@ class RAK3172Communicator:
 
         - connect() / disconnect()
         - send_command("AT+...") -> List[str] of response lines
+        - send_batch(["AT+...", ...]) -> List[str] of response lines for all commands
+        - wait_for_event(pattern, timeout) -> matching URC line, or None
         - send_data(payload) -> sends AT+SEND=1:<hex>, returns full response as a single string
-        - check_downlink() -> last RX_1 hex payload (if any), else None
+        - check_downlink() -> oldest unread RX_1 hex payload (if any), else None
         """
-        self.last_downlink: Optional[str] = None
+        # RX_1 payloads captured by whichever thread is talking to the
+        # module, popped by the control loop via check_downlink()
+        self._downlinks: "queue.SimpleQueue[str]" = queue.SimpleQueue()
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.ser: Optional[serial.Serial] = None
+        # Bytes read from the UART but not yet split into lines, and
+        # decoded lines not yet consumed
+        self._rxbuf = bytearray()
+        self._lines: Deque[str] = deque()
+        # Recent unsolicited "+EVT:..." lines (TX_DONE, RX_1, JOINED, ...)
+        self.events: Deque[str] = deque(maxlen=16)
 
     # ------------------------------------------------------------------
     # Basic serial lifecycle
@@ -26,6 +46,14 @@ class RAK3172Communicator:
     def connect(self) -> None:
         """Open the serial connection to the RAK3172."""
         self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+        self._rxbuf.clear()
+        self._lines.clear()
+        self.events.clear()
+        try:
+            # Skip the driver's read coalescing timer (Linux ASYNC_LOW_LATENCY)
+            self.ser.set_low_latency_mode(True)
+        except Exception:
+            pass  # not supported by every USB-serial driver
         print(f"Connected to {self.port} at {self.baudrate} baud.")
 
     def disconnect(self) -> None:
@@ -37,8 +65,8 @@ class RAK3172Communicator:
     @property
     def serial_port(self) -> serial.Serial:
         """
-        Expose the underlying serial port for advanced reads
-        (used by reconnect_rak() to watch join events).
+        Expose the underlying serial port for advanced use. Reads should
+        go through the communicator so buffered lines aren't skipped.
         """
         if not self.ser:
             raise ValueError("Serial port not initialized. Call connect() first.")
@@ -48,25 +76,166 @@ class RAK3172Communicator:
     # AT helpers
     # ------------------------------------------------------------------
 
-    def send_command(self, command: str) -> List[str]:
+    def _split_lines(self) -> None:
+        """Move every complete line in _rxbuf onto the decoded line queue."""
+        buf = self._rxbuf
+        end = buf.rfind(b"\n")
+        if end >= 0:
+            # Decode every complete line in one go; keep the partial tail
+            self._lines.extend(buf[: end + 1].decode("utf-8", errors="ignore").splitlines())
+            del buf[: end + 1]
+
+    def _next_line(self, deadline: float) -> Optional[str]:
+        """
+        Return the next non-empty line from the UART, or None once the
+        monotonic `deadline` has passed.
+        """
+        lines = self._lines
+        while True:
+            while lines:
+                line = lines.popleft().strip()
+                if line:
+                    return line
+
+            self._split_lines()
+            if lines:
+                continue
+
+            if time.monotonic() >= deadline:
+                return None
+
+            # Block for the first byte, then take whatever else is queued
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if chunk:
+                self._rxbuf += chunk
+
+    def _on_event(self, line: str) -> None:
+        """Record an unsolicited +EVT line and capture any RX_1 downlink."""
+        self.events.append(line)
+        m = _RX1_RE.search(line)
+        if m:
+            self._downlinks.put(m.group(1).upper())
+
+    def _drain_events(self) -> None:
+        """
+        Handle +EVT lines already received; leave anything else queued
+        (the next command discards it).
+        """
+        self._split_lines()
+        rest = [line for line in self._lines if line.strip()]
+        self._lines.clear()
+        for line in rest:
+            if line.strip().startswith("+EVT:"):
+                self._on_event(line.strip())
+            else:
+                self._lines.append(line)
+
+    def _discard_stale(self) -> None:
+        """
+        Drop anything already received before a new command is written: a
+        late reply to an earlier (timed-out) command would otherwise be read
+        as this command's reply. +EVT lines are still handled.
+        """
+        waiting = self.ser.in_waiting
+        if waiting:
+            self._rxbuf += self.ser.read(waiting)
+        self._split_lines()
+        for line in self._lines:
+            line = line.strip()
+            if line.startswith("+EVT:"):
+                self._on_event(line)
+        self._lines.clear()
+        # A partial line here belongs to a stale reply too
+        self._rxbuf.clear()
+
+    def _read_response(self, count: int, timeout: float) -> List[str]:
+        """
+        Collect reply lines until `count` final status lines (OK, ERROR or
+        AT_*) have been read, or `timeout` seconds have passed. "+EVT:"
+        lines go to _on_event() rather than the reply.
+        """
+        lines: List[str] = []
+        done = 0
+        deadline = time.monotonic() + timeout
+        while done < count:
+            line = self._next_line(deadline)
+            if line is None:
+                break
+            if line.startswith("+EVT:"):
+                self._on_event(line)
+                continue
+            lines.append(line)
+            if line == "OK" or line.startswith("ERROR") or line.startswith("AT_"):
+                done += 1
+        # Pick up URCs that came in with the reply (e.g. RX_1)
+        self._drain_events()
+        return lines
+
+    def send_command(self, command: str, timeout: float = 2.0) -> List[str]:
         """
         Send a raw AT command and return the response lines.
 
+        Returns as soon as a final status line (OK, ERROR or AT_* error
+        code) is read, or after `timeout` seconds. "+EVT:" lines are
+        unsolicited and often late (e.g. the TX_DONE of the previous
+        AT+SEND), so they never end a command; they are recorded in
+        `events` instead of the returned lines. Any other input still
+        pending from an earlier command is discarded before the write.
+
         Example:
             send_command("AT+NJS?")
         """
         if not self.ser or not self.ser.is_open:
             raise ConnectionError("Serial connection is not open.")
 
+        self._discard_stale()
+
         # Ensure proper line ending and encode
         self.ser.write((command + "\r\n").encode("utf-8"))
-        # Give module time to respond
-        time.sleep(0.5)
 
-        raw = self.ser.read_all().decode("utf-8", errors="ignore").strip()
-        if not raw:
-            return []
-        return raw.splitlines()
+        return self._read_response(1, timeout)
+
+    def wait_for_event(self, pattern: "re.Pattern[str]", timeout: float) -> Optional[str]:
+        """
+        Wait up to `timeout` seconds for a line matching `pattern` and
+        return it, or None. +EVT lines already received (e.g. a JOINED that
+        came in with the AT+JOIN reply) are checked first.
+        """
+        if not self.ser or not self.ser.is_open:
+            raise ConnectionError("Serial connection is not open.")
+
+        for event in self.events:
+            if pattern.search(event):
+                self.events.remove(event)
+                return event
+
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                return None
+            if pattern.search(line):
+                return line
+            if line.startswith("+EVT:"):
+                self._on_event(line)
+
+    def send_batch(self, commands: List[str], overall_timeout: float = 5.0) -> List[str]:
+        """
+        Send several AT commands in a single write and return all response lines.
+
+        Waits until one final status line (OK, ERROR or AT_*) per command
+        has arrived, or until overall_timeout seconds have passed.
+
+        Example:
+            send_batch(["AT+NWM=1", "AT+NJM=1"])
+        """
+        if not self.ser or not self.ser.is_open:
+            raise ConnectionError("Serial connection is not open.")
+
+        self._discard_stale()
+        self.ser.write(("\r\n".join(commands) + "\r\n").encode("utf-8"))
+
+        return self._read_response(len(commands), overall_timeout)
 
     # ------------------------------------------------------------------
     # Uplink + downlink
@@ -79,16 +248,18 @@ class RAK3172Communicator:
           - str: treat as hex string (optional '0x' prefix, spaces allowed).
 
         Returns an uppercase hex string suitable for AT+SEND.
+        Raises ValueError if a str payload is not valid hex.
         """
         if isinstance(payload, (bytes, bytearray)):
             return payload.hex().upper()
 
         if isinstance(payload, str):
-            # Strip common noise like "0x" prefix and spaces / newlines.
-            cleaned = payload.strip().replace(" ", "").replace("\n", "")
-            if cleaned.startswith("0x") or cleaned.startswith("0X"):
+            # Strip common noise like "0x" prefix and whitespace, then
+            # round-trip through bytes to validate and normalize at once.
+            cleaned = payload.strip()
+            if cleaned[:2] in ("0x", "0X"):
                 cleaned = cleaned[2:]
-            return cleaned.upper()
+            return bytes.fromhex(cleaned.translate(_WS_TBL)).hex().upper()
 
         raise TypeError(
             f"Unsupported payload type {type(payload)}; "
@@ -97,8 +268,9 @@ class RAK3172Communicator:
 
     def send_data(self, payload: Union[str, bytes, bytearray]) -> str:
         """
-        Send uplink data using AT+SEND and capture any RX_1 downlink.
-        Treats immediate "OK" as a successful send (RAK3172 behavior).
+        Send uplink data using AT+SEND. Treats immediate "OK" as a
+        successful send (RAK3172 behavior); an RX_1 downlink is captured
+        by send_command() whenever it arrives.
         """
         if not self.ser or not self.ser.is_open:
             raise ConnectionError("Serial connection is not open.")
@@ -109,38 +281,28 @@ class RAK3172Communicator:
         # Send the command
         response_lines = self.send_command(at_command)
 
-        # Consider "OK" or "+EVT:TX_DONE" as success.
-        # Do NOT treat missing TX_DONE as a failure (RAK often sends it late).
-        success = False
-
-        for line in response_lines:
-            if line.strip() == "OK":
-                success = True
-            if "+EVT:TX_DONE" in line:
-                success = True
-
-        # Capture downlink if present
-        for line in reversed(response_lines):
-            if "+EVT:RX_1" in line and ":" in line:
-                parts = line.strip().split(":")
-                candidate = parts[-1].strip()
-                if candidate and all(c in "0123456789abcdefABCDEF" for c in candidate):
-                    self.last_downlink = candidate.upper()
-                    break
+        # Scan the whole response once instead of line by line.
+        raw_upper = "\n".join(response_lines).upper()
+
+        # Do NOT wait for +EVT:TX_DONE (RAK often sends it late).
+        success = any(line.strip() == "OK" for line in response_lines)
 
         if not success:
+            # Pass the join error through so callers can report the cause.
+            if "AT_NO_NETWORK_JOINED" in raw_upper:
+                return "AT_NO_NETWORK_JOINED"
             return "ERROR"
 
         return "OK"
 
     def check_downlink(self) -> Optional[str]:
         """
-        Return the last received downlink hex payload (if any), and clear it.
+        Pop the oldest received downlink hex payload, or return None.
 
-        Used by main.py to poll for new downlink commands.
+        Used by main.py to poll for new downlink commands. Safe to call
+        while another thread is sending.
         """
-        if self.last_downlink:
-            dl = self.last_downlink
-            self.last_downlink = None
-            return dl
-        return None
+        try:
+            return self._downlinks.get_nowait()
+        except queue.Empty:
+            return None
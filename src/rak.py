@@ -1,4 +1,5 @@
 import logging
+import operator
 import serial
 import RPi.GPIO as GPIO
 from src.config import MAX_RETRIES, SITE_ID
@@ -6,13 +7,38 @@ from src.model.rak3172_comm import RAK3172Communicator
 from src.config import RELAY_DEV, ALARM_GPIO_PIN
 import time
 import json
+import random
+import re
+import struct
 
 log = logging.getLogger(__name__)
 
+# 14-byte uplink frame (see send_data_to_chirpstack for the layout).
+# The buffer is reused across uplinks; sends are never concurrent.
+_UPLINK_STRUCT = struct.Struct(">BBHHHHHH")
+_PAYLOAD_BUF = bytearray(_UPLINK_STRUCT.size)
+
+# Join URC ("+EVT:JOINED", "Network joined", ...)
+_JOIN_RE = re.compile(r"JOINED", re.IGNORECASE)
+
+# AT+NJS reply meaning "joined": "1", "+NJS:1", "AT+NJS=1", ...
+_NJS_JOINED_RE = re.compile(r"^(?:(?:AT)?\+?NJS\s*[:=]\s*)?1$", re.IGNORECASE)
+
+# Telemetry fields used by the uplink frame, fetched in one call. main()
+# always builds the dict with every key.
+_TELEMETRY_FIELDS = operator.itemgetter(
+    "depth", "current_mA", "voltage", "start", "stop",
+    "hi_alarm", "lo_alarm", "override", "pump_on",
+)
+
 # How often to check join status (in number of sends)
 _NJS_CHECK_INTERVAL = 10
 _njs_send_counter = 0
 
+# Connect retry back-off: base * 2**(attempt-1), +0-50% jitter, capped
+_CONNECT_BACKOFF_BASE_S = 1.0
+_CONNECT_BACKOFF_MAX_S = 30.0
+
 
 # ---------------------------------------------------------------------------
 # Internal helpers
@@ -27,24 +53,11 @@ def _parse_njs_response(lines: list[str]) -> bool:
       - "+NJS:0" / "+NJS:1"
       - "AT+NJS=0" / "AT+NJS=1"
 
-    We treat anything containing '1' (and not obviously just help text)
-    as "joined".
+    Help text ("AT+NJS,R: get the join status (0 = not joined, 1 = joined)")
+    and unrelated URCs don't match.
     """
-    for line in lines:
-        s = line.strip()
-        if not s:
-            continue
-
-        # Help text looks like: "AT+NJS,R: get the join status (0 = not joined, 1 = joined)"
-        if "get the join status" in s:
-            continue
-
-        if "NJS" in s and "1" in s:
-            return True
-        if s == "1":
-            return True
-
-    return False
+    match = _NJS_JOINED_RE.match
+    return any(match(line.strip()) for line in lines)
 
 
 # ---------------------------------------------------------------------------
@@ -67,57 +80,53 @@ def connect() -> RAK3172Communicator | None:
         try:
             rak = RAK3172Communicator(port)
             rak.connect()
-            log.info(f"[RAK] Connected to RAK3172 on {port}")
+            log.info("[RAK] Connected to RAK3172 on %s", port)
 
             # Make sure we are in LoRaWAN + OTAA mode
             try:
-                rak.send_command("AT+NWM=1")
-                rak.send_command("AT+NJM=1")
+                setup = rak.send_batch(["AT+NWM=1", "AT+NJM=1"])
+                if any("ERROR" in line for line in setup):
+                    log.warning("[RAK] NWM/NJM setup response: %s", " | ".join(setup))
             except Exception as e:
-                log.warning(f"[RAK] NWM/NJM setup warning: {e}")
+                log.warning("[RAK] NWM/NJM setup warning: %s", e)
 
             # Check join status
             joined = False
             try:
                 status = rak.send_command("AT+NJS")
-                log.info("[RAK] NJS check (connect) -> " + " | ".join(status))
+                log.info("[RAK] NJS check (connect) -> %s", " | ".join(status))
                 if _parse_njs_response(status):
                     joined = True
                     log.info("[RAK] Already joined (NJS=1).")
             except Exception as e:
-                log.warning(f"[RAK] NJS query failed: {e}")
+                log.warning("[RAK] NJS query failed: %s", e)
 
             # If not joined, attempt join
             if not joined:
                 log.info("[RAK] Not joined, sending AT+JOIN=1:1:10:5 ...")
                 join_lines = rak.send_command("AT+JOIN=1:1:10:5")
-                log.info("[RAK] JOIN immediate response: " + " | ".join(join_lines))
-
-                # Watch the UART for join events for up to 30 seconds
-                for _ in range(30):
-                    time.sleep(1)
-                    buf = rak.serial_port.read_all().decode(errors="ignore")
-                    if not buf:
-                        continue
-                    buf_upper = buf.upper()
-                    log.info(f"[RAK] Join event RX: {buf.strip()}")
-                    if "JOINED" in buf_upper or "NETWORK JOINED" in buf_upper:
-                        joined = True
-                        log.info("[RAK] Join success detected from UART.")
-                        break
+                log.info("[RAK] JOIN immediate response: %s", " | ".join(join_lines))
+
+                # Wait up to 30 seconds for the join URC. Goes through the
+                # communicator so a JOINED that arrived with the AT+JOIN
+                # reply (already buffered) is seen straight away.
+                event = rak.wait_for_event(_JOIN_RE, 30)
+                if event:
+                    joined = True
+                    log.info("[RAK] Join success detected from UART: %s", event)
 
                 if not joined:
                     # Final status check
                     try:
                         status2 = rak.send_command("AT+NJS")
-                        log.info("[RAK] NJS (post-join) -> " + " | ".join(status2))
+                        log.info("[RAK] NJS (post-join) -> %s", " | ".join(status2))
                         if _parse_njs_response(status2):
                             joined = True
                             log.info("[RAK] Join confirmed via NJS=1.")
                         else:
                             log.warning("[RAK] Still not joined after join window.")
                     except Exception as e:
-                        log.warning(f"[RAK] NJS post-join query failed: {e}")
+                        log.warning("[RAK] NJS post-join query failed: %s", e)
 
             if not joined:
                 log.warning(
@@ -128,8 +137,14 @@ def connect() -> RAK3172Communicator | None:
             return rak
 
         except Exception as e:
-            log.error(f"[RAK] Connect error ({attempt}/{MAX_RETRIES}): {e}")
-            time.sleep(2)
+            log.error("[RAK] Connect error (%d/%d): %s", attempt, MAX_RETRIES, e)
+            if attempt < MAX_RETRIES:
+                delay = min(
+                    _CONNECT_BACKOFF_MAX_S,
+                    _CONNECT_BACKOFF_BASE_S * 2 ** (attempt - 1),
+                ) * (1 + random.random() * 0.5)
+                log.info("[RAK] Retrying connect in %.1f s", delay)
+                time.sleep(delay)
 
     log.error("[RAK] Max retries reached. Could not connect to RAK3172.")
     return None
@@ -150,11 +165,11 @@ def ensure_joined(
     # 1) Query join status
     try:
         resp = rak.send_command("AT+NJS")
-        log.info(f"[RAK] NJS check -> {' | '.join(resp)}")
+        log.info("[RAK] NJS check -> %s", " | ".join(resp))
         if _parse_njs_response(resp):
             return True
     except Exception as e:
-        log.warning(f"[RAK] NJS check failed: {e}")
+        log.warning("[RAK] NJS check failed: %s", e)
         # fall through and *attempt* a join anyway
 
     log.warning("[RAK] Module reports NOT JOINED; attempting re-join...")
@@ -163,9 +178,9 @@ def ensure_joined(
     for attempt in range(1, max_join_attempts + 1):
         try:
             resp = rak.send_command(join_cmd)
-            log.info(f"[RAK] JOIN attempt {attempt}: immediate response: {' | '.join(resp)}")
+            log.info("[RAK] JOIN attempt %d: immediate response: %s", attempt, " | ".join(resp))
         except Exception as e:
-            log.error(f"[RAK] JOIN command failed on attempt {attempt}: {e}")
+            log.error("[RAK] JOIN command failed on attempt %d: %s", attempt, e)
             continue
 
         # Allow time for join exchange and EVTs
@@ -173,17 +188,84 @@ def ensure_joined(
 
         try:
             resp2 = rak.send_command("AT+NJS")
-            log.info(f"[RAK] NJS after JOIN attempt {attempt} -> {' | '.join(resp2)}")
+            log.info("[RAK] NJS after JOIN attempt %d -> %s", attempt, " | ".join(resp2))
             if _parse_njs_response(resp2):
                 log.info("[RAK] Re-join succeeded according to AT+NJS.")
                 return True
         except Exception as e:
-            log.warning(f"[RAK] NJS re-check failed after JOIN attempt {attempt}: {e}")
+            log.warning("[RAK] NJS re-check failed after JOIN attempt %d: %s", attempt, e)
 
     log.error("[RAK] Re-join failed after max attempts.")
     return False
 
 
+def _u16(value: int) -> int:
+    """Saturate a scaled reading to the uint16 range of the uplink fields."""
+    return 0 if value < 0 else (0xFFFF if value > 0xFFFF else value)
+
+
+def _pack_telemetry(telemetry: dict) -> bytearray:
+    """
+    Scale the telemetry fields and pack them into the shared uplink buffer.
+    See send_data_to_chirpstack() for the frame layout.
+    """
+    # Extract fields from the telemetry dict. The flags are already bools;
+    # start/stop come from the operator-edited setpoints file, so the
+    # numeric fields are still coerced.
+    (depth_ft, current_mA, voltage_V, start_ft, stop_ft,
+     hi_alarm, lo_alarm, override, pump_on) = _TELEMETRY_FIELDS(telemetry)
+    depth_ft   = float(depth_ft)
+    current_mA = float(current_mA)
+    voltage_V  = float(voltage_V)
+    start_ft   = float(start_ft)
+    stop_ft    = float(stop_ft)
+
+    site_id = SITE_ID
+
+    # Scale to integers (match legacy behavior)
+    depth_x100   = int(round(depth_ft * 100.0))
+    current_uA   = int(round(current_mA * 1000.0))
+    voltage_mV   = int(round(voltage_V * 1000.0))
+    start_x100   = int(round(start_ft * 100.0))
+    stop_x100    = int(round(stop_ft * 100.0))
+
+    # Flags bitfield (same as legacy main)
+    flags = hi_alarm | (lo_alarm << 1) | (override << 2) | (pump_on << 3)
+
+    # Build 14-byte payload. Out-of-range readings saturate instead of
+    # wrapping (a 700 ft spike must not decode as a small depth).
+    payload = _PAYLOAD_BUF
+    _UPLINK_STRUCT.pack_into(
+        payload, 0,
+        1,                       # protocol version
+        flags,
+        _u16(depth_x100),
+        _u16(current_uA),
+        _u16(voltage_mV),
+        _u16(start_x100),
+        _u16(stop_x100),
+        site_id,
+    )
+
+    # Log the packed frame for debugging (skip the formatting when INFO is off)
+    if log.isEnabledFor(logging.INFO):
+        log.info(
+            "[SEND] Packed uplink len=%d "
+            "depth_ft=%.3f (x100=%d) mA=%.3f (uA=%d) "
+            "volts=%.3f (mV=%d) start_ft=%.3f (x100=%d) "
+            "stop_ft=%.3f (x100=%d) flags=0x%02X site_id=0x%04X",
+            len(payload),
+            depth_ft, depth_x100,
+            current_mA, current_uA,
+            voltage_V, voltage_mV,
+            start_ft, start_x100,
+            stop_ft, stop_x100,
+            flags, site_id,
+        )
+
+    return payload
+
+
 def send_data_to_chirpstack(rak: RAK3172Communicator, telemetry: dict) -> bool:
     """
     Build the 14-byte binary payload compatible with the legacy codec and send it.
@@ -214,86 +296,19 @@ def send_data_to_chirpstack(rak: RAK3172Communicator, telemetry: dict) -> bool:
             return False
 
     try:
-        # Extract and normalize fields from the telemetry dict
-        depth_ft   = float(telemetry.get("depth", 0.0))
-        current_mA = float(telemetry.get("current_mA", 0.0))
-        voltage_V  = float(telemetry.get("voltage", 0.0))
-        start_ft   = float(telemetry.get("start", 0.0))
-        stop_ft    = float(telemetry.get("stop", 0.0))
-
-        hi_alarm   = bool(telemetry.get("hi_alarm", False))
-        lo_alarm   = bool(telemetry.get("lo_alarm", False))
-        override   = bool(telemetry.get("override", False))
-        pump_on    = bool(telemetry.get("pump_on", False))
-
-        site_id = SITE_ID
-
-        # Scale to integers (match legacy behavior)
-        depth_x100   = int(round(depth_ft * 100.0))
-        current_uA   = int(round(current_mA * 1000.0))
-        voltage_mV   = int(round(voltage_V * 1000.0))
-        start_x100   = int(round(start_ft * 100.0))
-        stop_x100    = int(round(stop_ft * 100.0))
-
-        # Flags bitfield (same as legacy main)
-        flags = 0
-        if hi_alarm:
-            flags |= 0x01
-        if lo_alarm:
-            flags |= 0x02
-        if override:
-            flags |= 0x04
-        if pump_on:
-            flags |= 0x08
-
-        # Build 14-byte payload
-        payload = bytearray(14)
-        payload[0] = 1           # protocol version
-        payload[1] = flags
-
-        payload[2] = (depth_x100 >> 8) & 0xFF
-        payload[3] = depth_x100 & 0xFF
-
-        payload[4] = (current_uA >> 8) & 0xFF
-        payload[5] = current_uA & 0xFF
-
-        payload[6] = (voltage_mV >> 8) & 0xFF
-        payload[7] = voltage_mV & 0xFF
-
-        payload[8]  = (start_x100 >> 8) & 0xFF
-        payload[9]  = start_x100 & 0xFF
-
-        payload[10] = (stop_x100 >> 8) & 0xFF
-        payload[11] = stop_x100 & 0xFF
-
-        payload[12] = (site_id >> 8) & 0xFF
-        payload[13] = site_id & 0xFF
-
-        # Log the packed frame for debugging
-        log.info(
-            "[SEND] Packed uplink len=%d "
-            "depth_ft=%.3f (x100=%d) mA=%.3f (uA=%d) "
-            "volts=%.3f (mV=%d) start_ft=%.3f (x100=%d) "
-            "stop_ft=%.3f (x100=%d) flags=0x%02X site_id=0x%04X",
-            len(payload),
-            depth_ft, depth_x100,
-            current_mA, current_uA,
-            voltage_V, voltage_mV,
-            start_ft, start_x100,
-            stop_ft, stop_x100,
-            flags, site_id,
-        )
+        payload = _pack_telemetry(telemetry)
 
-        # Hex-encode for AT+SEND (same as legacy rak3172_comm usage)
-        payload_hex = payload.hex()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[SEND] Payload hex: %s", payload.hex())
 
-        resp = rak.send_data(payload_hex)
+        # send_data() hex-encodes raw bytes itself for AT+SEND
+        resp = rak.send_data(payload)
         if resp is None or str(resp).strip() == "":
             log.debug("[SEND] RAK: no response")
             return False
 
         resp_str = str(resp).strip()
-        log.info(f"[SEND] RAK: {resp_str}")
+        log.info("[SEND] RAK: %s", resp_str)
 
         if "AT_NO_NETWORK_JOINED" in resp_str:
             log.error("[SEND] RAK reports no network joined.")
@@ -302,9 +317,27 @@ def send_data_to_chirpstack(rak: RAK3172Communicator, telemetry: dict) -> bool:
         return True
 
     except Exception as e:
-        log.error(f"[SEND] Exception while sending uplink: {e}")
+        log.error("[SEND] Exception while sending uplink: %s", e)
+        return False
+
+
+def check_health(rak: RAK3172Communicator) -> bool:
+    """
+    Cheap liveness probe: send a bare "AT" and return True if the module
+    answers OK on the already-open port. Used to tell a transient send
+    failure apart from a dead port before paying for a full reconnect.
+    """
+    if rak is None:
+        return False
+
+    try:
+        resp = rak.send_command("AT")
+    except Exception as e:
+        log.warning("[RAK] Health check failed: %s", e)
         return False
 
+    return any(line.strip().upper() == "OK" for line in resp)
+
 
 def reconnect_rak(rak: RAK3172Communicator) -> RAK3172Communicator | None:
     """
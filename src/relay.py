@@ -1,15 +1,75 @@
+import atexit
 import logging
+import threading
+import time
+from typing import Optional
+
 import serial           # if used there
 import RPi.GPIO as GPIO
 from src.config import RELAY_DEV, ALARM_GPIO_PIN
 
 log = logging.getLogger(__name__)
 
+# Last state we successfully commanded. None means "unknown" (startup, or
+# after a serial/GPIO error) so the next call always goes to the hardware.
+_pump_state: Optional[bool] = None
+_alarm_state: Optional[bool] = None
+
+# The relay port stays open between commands; reopening a CDC-ACM port
+# costs far more than the few bytes we write.
+_relay_ser: Optional[serial.Serial] = None
+_relay_lock = threading.Lock()
+
 # ---------------------------------------------------------------------------
 # Relay helpers
 # ---------------------------------------------------------------------------
 
-def send_relay_command(command: str) -> None:
+def _get_relay() -> serial.Serial:
+    """
+    Return the shared relay port, opening it on first use.
+    Caller must hold _relay_lock.
+    """
+    global _relay_ser
+
+    if _relay_ser is None or not _relay_ser.is_open:
+        # exclusive: no other process can interleave commands on the port.
+        # No hardware flow control; write_timeout keeps a wedged CDC
+        # endpoint from hanging pump control. DTR is set before open() so
+        # pyserial applies it as part of opening the port instead of
+        # leaving DTR asserted (dsrdtr/rtscts don't control that).
+        _relay_ser = serial.Serial(
+            baudrate=9600,
+            timeout=1,
+            write_timeout=0.5,
+            exclusive=True,
+        )
+        _relay_ser.port = RELAY_DEV
+        _relay_ser.dtr = False
+        _relay_ser.open()
+        try:
+            # Skip the driver's read coalescing timer (Linux ASYNC_LOW_LATENCY)
+            _relay_ser.set_low_latency_mode(True)
+        except Exception as e:
+            log.debug(f"[RELAY] Low-latency mode not available on {RELAY_DEV}: {e}")
+    return _relay_ser
+
+
+def _close_relay() -> None:
+    """Close the shared relay port; the next command reopens it."""
+    global _relay_ser
+
+    if _relay_ser is not None:
+        try:
+            _relay_ser.close()
+        except Exception:
+            pass
+        _relay_ser = None
+
+
+atexit.register(_close_relay)
+
+
+def send_relay_command(command: str) -> bool:
     """
     Send a Numato-style relay command using /dev/ttyACM0.
 
@@ -17,50 +77,136 @@ def send_relay_command(command: str) -> None:
         relay on 0
         relay off 0
         relay read 0
+
+    Returns True if the command was written, False on a serial error.
     """
-    try:
-        cmd = (command + "\r").encode()
-        with serial.Serial(RELAY_DEV, 9600, timeout=1) as ser:
+    cmd = (command + "\r").encode()
+    with _relay_lock:
+        try:
+            ser = _get_relay()
+            # The board echoes each command and prints a '>' prompt. Nothing
+            # reads those back on the write path, so drop them here before
+            # they fill the tty buffer and stall the CDC endpoint.
+            ser.reset_input_buffer()
             ser.write(cmd)
-        log.info(f"[RELAY] Sent '{command}' to {RELAY_DEV}")
-    except Exception as e:
-        log.error(f"[RELAY] Serial error on {RELAY_DEV}: {e}")
+            ser.flush()
+        except Exception as e:
+            _close_relay()
+            log.error(f"[RELAY] Serial error on {RELAY_DEV}: {e}")
+            return False
+    log.info(f"[RELAY] Sent '{command}' to {RELAY_DEV}")
+    return True
 
 
-def turn_pump_on() -> None:
-    send_relay_command("relay on 0")
-    log.info("[PUMP] Pump turned ON")
+def _set_pump(state: bool, force: bool = False) -> None:
+    """
+    Drive the pump relay, skipping the serial write when the relay is
+    already known to be in the requested state (unless force=True).
+    """
+    global _pump_state
 
+    if not force and _pump_state == state:
+        log.debug(f"[PUMP] Already {'ON' if state else 'OFF'}; skipping relay write")
+        return
 
-def turn_pump_off() -> None:
-    send_relay_command("relay off 0")
-    log.info("[PUMP] Pump turned OFF")
+    if send_relay_command("relay on 0" if state else "relay off 0"):
+        _pump_state = state
+        log.info(f"[PUMP] Pump turned {'ON' if state else 'OFF'}")
+    else:
+        # Unknown after a failed write; make the next call retry.
+        _pump_state = None
 
 
-def is_pump_on() -> bool:
+def turn_pump_on(force: bool = False) -> None:
+    _set_pump(True, force=force)
+
+
+def turn_pump_off(force: bool = False) -> None:
+    _set_pump(False, force=force)
+
+
+def _query_relay_state() -> bool:
     """
-    Try to query relay state. Returns True if the relay reports ON, else False.
+    Ask the Numato board for the relay state. Returns True if it reports ON.
 
     Note: Numato's response format can be odd; this is best-effort and
     not relied on for normal runtime control (we track state in software).
     """
+    global _pump_state
+
     try:
-        with serial.Serial(RELAY_DEV, 9600, timeout=1) as ser:
-            ser.write(b"relay read 0\r")
-            response = ser.readline().decode(errors="ignore").strip().lower()
-        log.info(f"[RELAY] State response: '{response}'")
-        return "on" in response
+        with _relay_lock:
+            try:
+                ser = _get_relay()
+                # Drop command echoes left over from earlier writes
+                ser.reset_input_buffer()
+                ser.write(b"relay read 0\r")
+
+                # Numato echoes the command, then the state, then a '>'
+                # prompt. Take bytes as they arrive instead of blocking in
+                # readline() for the full port timeout.
+                buf = bytearray()
+                timeout = serial.Timeout(0.2)
+                while not timeout.expired():
+                    n = ser.in_waiting
+                    if n:
+                        buf += ser.read(n)
+                        if b">" in buf:
+                            break
+                    else:
+                        time.sleep(0.005)
+                if not buf:
+                    buf += ser.readline()
+            except Exception:
+                _close_relay()
+                raise
+        response = buf.decode(errors="ignore").strip().lower()
+        log.info("[RELAY] State response: %r", response)
+        # Ignore the echoed command and prompt so only the reported state
+        # is matched
+        words = response.replace("relay read 0", "").replace(">", " ").split()
+        if "on" in words:
+            _pump_state = True
+        elif "off" in words:
+            _pump_state = False
+        else:
+            # No state line: don't cache a guess, so the next command is
+            # always written to the board
+            log.warning("[RELAY] No state in reply from %s", RELAY_DEV)
+            _pump_state = None
+            return False
+        return _pump_state
     except Exception as e:
         log.error(f"[RELAY] State-check error: {e}")
         return False
 
 
-def set_alarm_light_hw(state: bool) -> None:
+def is_pump_on() -> bool:
+    """
+    Return the pump relay state.
+
+    Uses the last commanded state when known, so callers don't pay a
+    serial round-trip; only queries the board when the state is unknown.
+    """
+    if _pump_state is not None:
+        return _pump_state
+    return _query_relay_state()
+
+
+def set_alarm_light_hw(state: bool, force: bool = False) -> None:
     """
     Drive the panel alarm LED on GPIO17 only.
+    Skips the GPIO write when the LED is already in the requested state.
     """
+    global _alarm_state
+
+    if not force and _alarm_state == state:
+        return
+
     try:
         GPIO.output(ALARM_GPIO_PIN, GPIO.HIGH if state else GPIO.LOW)
+        _alarm_state = state
         log.info(f"[ALARM] Alarm {'ON' if state else 'OFF'}")
     except Exception as e:
+        _alarm_state = None
         log.error(f"[ALARM] Failed to set alarm state: {e}")
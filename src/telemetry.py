@@ -1,12 +1,23 @@
 # FILE: telemetry.py
 
 import logging
+from statistics import median
 
 from src.model.depth_telemetry import DepthTelemetry
-from src.config import RESISTOR_OHMS, MAX_DEPTH_FT, DEPTH_SCALING_FACTOR
+from src.config import (
+    RESISTOR_OHMS,
+    MAX_DEPTH_FT,
+    DEPTH_SCALING_FACTOR,
+    DEPTH_OVERSAMPLE_COUNT,
+)
 
 log = logging.getLogger(__name__)
 
+# Conversion constants, folded once at import (config is static at runtime)
+_MA_PER_VOLT = 1000.0 / RESISTOR_OHMS                       # V/R → A → mA
+_MAX_DEPTH_SCALED = MAX_DEPTH_FT * DEPTH_SCALING_FACTOR     # depth at 20 mA
+_FT_PER_MA = _MAX_DEPTH_SCALED / 16.0                       # over the 4–20 mA span
+
 
 def read_depth(chan):
     """
@@ -26,32 +37,30 @@ def read_depth(chan):
     if chan is None:
         raise RuntimeError("ADS1115 channel not initialized; cannot read depth.")
 
-    # Read shunt voltage from ADS1115
+    # Read shunt voltage from ADS1115; median of a short burst rejects
+    # single-sample spikes on the 4-20 mA loop
     try:
-        voltage = float(chan.voltage)  # ensure it's a plain float
+        voltage = float(median(chan.voltage for _ in range(DEPTH_OVERSAMPLE_COUNT)))
     except Exception as e:
-        log.error(f"[DEPTH] Failed to read ADC: {e}")
+        log.error("[DEPTH] Failed to read ADC: %s", e)
         raise
 
     # Convert voltage across shunt to loop current
-    mA = (voltage / RESISTOR_OHMS) * 1000.0  # V/R → A → mA
+    mA = voltage * _MA_PER_VOLT
 
     # Clamp to a sane range (0–25 mA)
-    mA_clamped = max(0.0, min(mA, 25.0))
+    mA_clamped = 0.0 if mA < 0.0 else (25.0 if mA > 25.0 else mA)
 
-    # Map 4–20 mA → 0–MAX_DEPTH_FT
+    # Map 4–20 mA → 0–MAX_DEPTH_FT, with the calibration factor applied
     if mA_clamped <= 4.0:
         depth = 0.0
     elif mA_clamped >= 20.0:
-        depth = MAX_DEPTH_FT
+        depth = _MAX_DEPTH_SCALED
     else:
-        depth = ((mA_clamped - 4.0) / 16.0) * MAX_DEPTH_FT
-
-    # Apply your calibration factor
-    depth *= DEPTH_SCALING_FACTOR
+        depth = (mA_clamped - 4.0) * _FT_PER_MA
 
     log.debug(
-        f"[DEPTH] V={voltage:.4f} V, I={mA_clamped:.3f} mA, depth={depth:.2f} ft"
+        "[DEPTH] V=%.4f V, I=%.3f mA, depth=%.2f ft", voltage, mA_clamped, depth
     )
 
     return DepthTelemetry(depth, mA_clamped, voltage)
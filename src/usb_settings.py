@@ -1,9 +1,14 @@
 ﻿import os
 import json
 import logging
+import re
+import atexit
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
 from datetime import datetime
 import time
-import shutil
+import zlib
 from src.config import LOG_DIR
 
 log = logging.getLogger(__name__)
@@ -20,43 +25,207 @@ COMMAND_FILE = os.path.join(USB_MOUNT_PATH, "command.txt")
 
 OVERRIDE_LOG_FILE = os.path.join(USB_MOUNT_PATH, "override_log.txt")
 
-def _log_to_targets(message: str, targets):
-    for path in targets:
+# Create the local log directory once here rather than before every write;
+# the USB root is expected to exist whenever the stick is mounted.
+try:
+    os.makedirs(LOCAL_LOG_DIR, exist_ok=True)
+except OSError as e:
+    log.warning(f"[LOG] Could not create {LOCAL_LOG_DIR}: {e}")
+
+# Cached USB presence check (see _usb_available)
+USB_CHECK_TTL_S = 2.0
+_usb_checked_at = None
+_usb_ok = False
+
+
+def _usb_available():
+    """
+    True if the USB stick looks mounted. Cached for USB_CHECK_TTL_S so a
+    missing stick costs one stat every couple of seconds, not a failed
+    open() plus a warning per write.
+    """
+    global _usb_checked_at, _usb_ok
+    now = time.monotonic()
+    if _usb_checked_at is None or now - _usb_checked_at > USB_CHECK_TTL_S:
+        _usb_ok = os.path.ismount(USB_MOUNT_PATH) or os.path.exists(SETPOINTS_FILE)
+        _usb_checked_at = now
+    return _usb_ok
+
+
+# --- Audit-log writes ---
+# Local log lines are written inline: the SD card is always there and the
+# write is cheap. USB lines are queued per target file and written by a
+# background thread, so a slow or wedged stick never stalls the caller and a
+# burst of changes costs one write + fsync per file instead of one per line.
+
+LOG_FLUSH_DELAY_S = 1.0   # how long to gather USB lines before a flush
+USB_LOG_QUEUE_MAX = 500   # per-file cap on queued USB lines; oldest dropped
+
+_pending_lines: defaultdict[str, deque] = defaultdict(lambda: deque(maxlen=USB_LOG_QUEUE_MAX))
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_local_lock = threading.Lock()
+_flush_event = threading.Event()
+_flusher: threading.Thread | None = None
+
+# Append-mode fds per log file. Local ones stay open (only touched under
+# _local_lock); USB ones live for one flush_logs() batch (under _flush_lock)
+# so the stick can still be unmounted cleanly.
+_log_fds: dict[str, int] = {}
+
+
+def _flusher_loop():
+    while True:
+        _flush_event.wait()
+        time.sleep(LOG_FLUSH_DELAY_S)
+        _flush_event.clear()
+        flush_logs()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flusher_loop, name="usb-log-flush", daemon=True)
+        _flusher.start()
+
+
+def _log_fd(path):
+    fd = _log_fds.get(path)
+    if fd is None:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _log_fds[path] = fd
+    return fd
+
+
+def _close_log_fd(path):
+    fd = _log_fds.pop(path, None)
+    if fd is not None:
         try:
-            parent = os.path.dirname(path)
-            # only ensure local directory; USB root should already exist
-            if parent and parent.startswith(LOCAL_LOG_DIR):
-                os.makedirs(parent, exist_ok=True)
-            with open(path, "a") as f:
-                f.write(message + "\n")
-                f.flush()
-                os.fsync(f.fileno())   # force write to media
-        except Exception as e:
-            log.warning(f"[LOG WRITE FAILED] {path}: {e}")
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def _write_log(path, data: str):
+    """Append data to path with one write() and fdatasync the fd."""
+    try:
+        # fdatasync skips the inode timestamp flush, which an append-only
+        # log doesn't need.
+        fd = _log_fd(path)
+        os.write(fd, data.encode("utf-8"))
+        os.fdatasync(fd)   # force write to media
+    except Exception as e:
+        # Drop the fd (e.g. USB stick pulled) so the next write reopens
+        _close_log_fd(path)
+        log.warning(f"[LOG WRITE FAILED] {path}: {e}")
+
+
+def _is_usb_path(path) -> bool:
+    return path.startswith(USB_MOUNT_PATH)
+
+
+def flush_logs():
+    """Write all queued USB audit-log lines to their files and fsync each once."""
+    with _flush_lock:
+        with _pending_lock:
+            batches = [(path, "".join(lines)) for path, lines in _pending_lines.items() if lines]
+            _pending_lines.clear()
+
+        for path, data in batches:
+            if not _usb_available():
+                _close_log_fd(path)
+                log.debug(f"[LOG] USB not mounted; dropping {len(data)} bytes for {path}")
+                continue
+            _write_log(path, data)
+            # Don't hold the stick busy between batches
+            _close_log_fd(path)
+
+
+def _shutdown_logs():
+    flush_logs()
+    with _flush_lock, _local_lock:
+        for path in list(_log_fds):
+            _close_log_fd(path)
+
+
+atexit.register(_shutdown_logs)
+
+
+def _log_to_targets(message: str, targets):
+    line = message + "\n"
+    queued = False
+    for path in dict.fromkeys(targets):   # de-duplicate, keep order
+        if not _is_usb_path(path):
+            with _local_lock:
+                _write_log(path, line)
+            continue
+        with _pending_lock:
+            pending = _pending_lines[path]
+            if len(pending) == pending.maxlen:
+                log.warning("[LOG] USB log queue full for %s; dropping oldest line", path)
+            pending.append(line)
+            _start_flusher()
+        queued = True
+    if queued:
+        _flush_event.set()
+
+# Last audit-log timestamp string, reused for events in the same second
+_ts_second = None
+_ts_string = ""
+
+
+def _now_string():
+    """Local time as "YYYY-MM-DD HH:MM:SS", formatted at most once per second."""
+    global _ts_second, _ts_string
+    second = int(time.time())
+    if second != _ts_second:
+        _ts_string = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        _ts_second = second
+    return _ts_string
+
 
 def log_override_change(state: bool, source: str = "runtime"):
     """Log an override change to both local and USB logs."""
     log.info(f"[LOG] override_change -> state={state} source={source}")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = _now_string()
     line = f"{timestamp} - Override {'ON' if state else 'OFF'} (source={source})"
     _log_to_targets(line, [LOCAL_OVERRIDE_LOG, OVERRIDE_LOG_FILE])
 
 
 def log_setting_change(key: str, old_value, new_value, source: str = "downlink"):
     """Log a single setting change to both local and USB logs."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = _now_string()
     line = f"{timestamp} - Setting '{key}': {old_value} -> {new_value} (source={source})"
     _log_to_targets(line, [LOCAL_SETTINGS_LOG, SETTINGS_LOG_FILE])
 
 
+# Parsed setpoints.json, keyed by the (inode, mtime_ns, size) of the file it
+# came from. Every _atomic_write() swaps in a new inode, which catches
+# same-size rewrites inside vfat's 2 s mtime granularity.
+_setpoints_cache = None
+
+
+def _read_setpoints_file():
+    """
+    Return a copy of the parsed setpoints.json, only re-reading the file
+    when its inode, mtime or size has changed. Raises FileNotFoundError if
+    absent.
+    """
+    global _setpoints_cache
+    st = os.stat(SETPOINTS_FILE)
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _setpoints_cache is None or _setpoints_cache[0] != key:
+        with open(SETPOINTS_FILE, 'r') as f:
+            _setpoints_cache = (key, json.load(f))
+    # Callers update the dict they get back; keep the cached one pristine
+    return dict(_setpoints_cache[1])
+
+
 def load_zero_offset():
     """Read the current zero_offset_ft from setpoints.json."""
     try:
-        if not os.path.exists(SETPOINTS_FILE):
-            raise FileNotFoundError(f"{SETPOINTS_FILE} not found")
-        with open(SETPOINTS_FILE, 'r') as f:
-            setpoints = json.load(f)
-            return setpoints.get("zero_offset_ft", 0.0)
+        setpoints = _read_setpoints_file()
+        return setpoints.get("zero_offset_ft", 0.0)
     except Exception as e:
         log.error(f"Failed to load zero offset: {e}")
         return 0.0
@@ -64,10 +233,10 @@ def load_zero_offset():
 def save_zero_offset(offset_ft):
     """Update the zero_offset_ft and ZERO_OFFSET values in setpoints.json."""
     try:
-        setpoints = {}
-        if os.path.exists(SETPOINTS_FILE):
-            with open(SETPOINTS_FILE, 'r') as f:
-                setpoints = json.load(f)
+        try:
+            setpoints = _read_setpoints_file()
+        except FileNotFoundError:
+            setpoints = {}
 
         if (setpoints.get("zero_offset_ft") != offset_ft or
             setpoints.get("ZERO_OFFSET") != offset_ft):
@@ -80,12 +249,86 @@ def save_zero_offset(offset_ft):
 
 def load_setpoints():
     """Load setpoints from the USB key."""
-    if not os.path.exists(SETPOINTS_FILE):
-        raise FileNotFoundError(f"Setpoints file not found at {SETPOINTS_FILE}")
-    with open(SETPOINTS_FILE, 'r') as f:
-        return json.load(f)
+    try:
+        return _read_setpoints_file()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Setpoints file not found at {SETPOINTS_FILE}") from None
+
 
 
+# Nesting depth of bulk_setpoints_update() and the directories whose
+# renames it still has to sync
+_bulk_depth = 0
+_bulk_dirty = set()
+
+
+def _fsync_dir(dirpath):
+    """fsync a directory, so a rename into it is durable."""
+    fd = os.open(dirpath or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def bulk_setpoints_update():
+    """
+    Defer the directory fsyncs after setpoints writes (and command.txt
+    appends) until the outermost block exits, so applying a burst of
+    downlinks syncs each directory once instead of per change. File data
+    is always synced before it is renamed into place.
+    """
+    global _bulk_depth
+    _bulk_depth += 1
+    try:
+        yield
+    finally:
+        _bulk_depth -= 1
+        if _bulk_depth == 0:
+            for d in _bulk_dirty:
+                try:
+                    _fsync_dir(d)
+                except Exception as e:
+                    log.warning(f"[SYNC] Deferred directory fsync failed for {d}: {e}")
+            _bulk_dirty.clear()
+            flush_commands()
+
+
+def _atomic_write(path, data: bytes):
+    """
+    Replace `path` with `data`: write a synced temp file next to it,
+    os.replace() it in and fsync the directory, so a power cut leaves either
+    the old or the new file, never a truncated one.
+    Inside bulk_setpoints_update() the directory fsync is deferred to the
+    block's end.
+    """
+    tmp = path + ".tmp"
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, data)
+            os.fdatasync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except Exception:
+        # Don't leave a half-written temp file behind
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    if _bulk_depth:
+        _bulk_dirty.add(os.path.dirname(path))
+    else:
+        _fsync_dir(os.path.dirname(path))
+
+
+# crc32 of the content last written to each file by this process, so a
+# write of identical bytes (and its fsync) can be skipped
+_content_hash: dict[str, int] = {}
+
 
 # Timestamp for last write to settings_log.txt
 last_write_time = 0  # global timestamp
@@ -95,13 +338,13 @@ def save_setpoints(setpoints):
     Save setpoints to the USB key, including ZERO_OFFSET.
     Only writes if there is a change to avoid excessive writes.
     """
-    global last_write_time
+    global last_write_time, _setpoints_cache
     now = time.time()
 
-    # Load the previous setpoints from the USB file
+    # Previous setpoints straight from the file: a single stat() when it
+    # hasn't changed, and never stale after an edit made on the stick
     try:
-        with open(SETPOINTS_FILE, "r") as f:
-            old_setpoints = json.load(f)
+        old_setpoints = _read_setpoints_file()
     except Exception:
         old_setpoints = {}
 
@@ -129,13 +372,22 @@ def save_setpoints(setpoints):
 
         try:
             # Write the updated setpoints to the USB drive
-            with open(SETPOINTS_FILE, "w") as f:
-                json.dump(full_setpoints, f, indent=2)
+            # Serialize once and write the same bytes to USB and the local copy
+            payload = json.dumps(full_setpoints, indent=2).encode("utf-8")
 
-            # After writing to USB, mirror to the local copy
+            _setpoints_cache = None
+            _atomic_write(SETPOINTS_FILE, payload)
+
+            # After writing to USB, mirror to the local copy unless it
+            # already holds these bytes
             try:
-                shutil.copy2(SETPOINTS_FILE, LOCAL_SETPOINTS_FILE)
-                log.info("[SYNC] Mirrored updated setpoints to local copy.")
+                h = zlib.crc32(payload)
+                if _content_hash.get(LOCAL_SETPOINTS_FILE) == h:
+                    log.debug("[SYNC] Local setpoints already match; skipping mirror.")
+                else:
+                    _atomic_write(LOCAL_SETPOINTS_FILE, payload)
+                    _content_hash[LOCAL_SETPOINTS_FILE] = h
+                    log.info("[SYNC] Mirrored updated setpoints to local copy.")
             except Exception as e:
                 log.error(f"[SYNC] Failed to copy setpoints to local: {e}")
 
@@ -155,34 +407,67 @@ def update_setpoints_if_changed(current_setpoints):
     try:
         new_setpoints = load_setpoints()
         if new_setpoints != current_setpoints:
-            print("[USB] Setpoints changed. Updating...")
+            log.info("[USB] Setpoints changed. Updating...")
             save_setpoints(new_setpoints)
             return new_setpoints
         else:
-            print("[USB] No change in setpoints.")
+            log.debug("[USB] No change in setpoints.")
     except Exception as e:
-        print(f"[USB] Error updating setpoints: {e}")
+        log.error("[USB] Error updating setpoints: %s", e)
     return current_setpoints
 
 # --- Sync Logic Between USB and Local Files ---
 
 LOCAL_SETPOINTS_FILE = "/home/pi/setpoints.json"
 
+# FAT stores mtimes at 2 s resolution; treat closer timestamps as equal so
+# copies don't ping-pong between the USB stick and the local disk.
+MTIME_SLACK_S = 2.0
+
+
+def _fast_copy(src, dst):
+    """
+    Copy the (small) file src over dst via _atomic_write(). Unlike
+    shutil.copy2 this skips the metadata copy, whose utime() on FAT costs
+    an extra directory write on the stick.
+    """
+    with open(src, "rb") as f:
+        data = f.read()
+    _atomic_write(dst, data)
+
+
+def _mtime(path):
+    """mtime of path from a single stat(), or 0 if the file doesn't exist."""
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0
+
 def sync_usb_to_local():
     """
     If the USB setpoints file exists and is newer than the local copy,
     copy it to /home/pi/setpoints.json so the control logic uses the latest settings.
     """
     try:
-        if not os.path.exists(SETPOINTS_FILE):
+        usb_mtime = _mtime(SETPOINTS_FILE)
+        if not usb_mtime:
             log.info("[SYNC] No USB setpoints file found; skipping sync.")
             return False
 
-        usb_mtime = os.path.getmtime(SETPOINTS_FILE)
-        local_mtime = os.path.getmtime(LOCAL_SETPOINTS_FILE) if os.path.exists(LOCAL_SETPOINTS_FILE) else 0
-
-        if usb_mtime > local_mtime:
-            shutil.copy2(SETPOINTS_FILE, LOCAL_SETPOINTS_FILE)
+        local_mtime = _mtime(LOCAL_SETPOINTS_FILE)
+
+        if usb_mtime > local_mtime + MTIME_SLACK_S:
+            # A newer mtime alone doesn't mean new content (FAT rounds
+            # mtimes, and our own mirror writes land on both sides)
+            with open(SETPOINTS_FILE, "rb") as f:
+                data = f.read()
+            h = zlib.crc32(data)
+            if _content_hash.get(LOCAL_SETPOINTS_FILE) == h:
+                log.debug("[SYNC] USB setpoints match local content; skipping copy.")
+                return False
+            # Already have the bytes, so write them rather than _fast_copy()
+            _atomic_write(LOCAL_SETPOINTS_FILE, data)
+            _content_hash[LOCAL_SETPOINTS_FILE] = h
             log.info("[SYNC] Copied newer USB setpoints to local file.")
             return True
         else:
@@ -198,14 +483,14 @@ def sync_local_to_usb():
     This ensures consistency if local changes happen (optional).
     """
     try:
-        if not os.path.exists(LOCAL_SETPOINTS_FILE):
+        local_mtime = _mtime(LOCAL_SETPOINTS_FILE)
+        if not local_mtime:
             return False
 
-        local_mtime = os.path.getmtime(LOCAL_SETPOINTS_FILE)
-        usb_mtime = os.path.getmtime(SETPOINTS_FILE) if os.path.exists(SETPOINTS_FILE) else 0
+        usb_mtime = _mtime(SETPOINTS_FILE)
 
-        if local_mtime > usb_mtime:
-            shutil.copy2(LOCAL_SETPOINTS_FILE, SETPOINTS_FILE)
+        if local_mtime > usb_mtime + MTIME_SLACK_S:
+            _fast_copy(LOCAL_SETPOINTS_FILE, SETPOINTS_FILE)
             log.info("[SYNC] Copied newer local setpoints to USB.")
             return True
     except Exception as e:
@@ -213,9 +498,38 @@ def sync_local_to_usb():
     return False
 
 
+# Commands decoded but not yet appended to command.txt
+_pending_commands = []
+
+
+def flush_commands():
+    """Append all pending commands to command.txt as JSON lines, one sync."""
+    if not _pending_commands:
+        return
+    data = "".join(json.dumps(c) + "\n" for c in _pending_commands).encode("utf-8")
+    count = len(_pending_commands)
+    _pending_commands.clear()
+    try:
+        fd = os.open(COMMAND_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fdatasync(fd)
+        finally:
+            os.close(fd)
+        log.info("[USB] Appended %d command(s) to %s", count, COMMAND_FILE)
+    except Exception as e:
+        log.error("[USB] Failed to write commands: %s", e)
+
+
+# Downlink command forms: bare keywords, or KEY=<number>
+_ATOMIC_COMMANDS = {"FORCE_PUMP_OFF", "ZERO_LEVEL"}
+_KV_COMMAND_RE = re.compile(r"^([A-Z_]+)=(-?\d+(?:\.\d+)?)$")
+
+
 def write_command_from_downlink(hex_payload):
     """
-    Decode hex payload and write it as a structured command to command.txt on the USB.
+    Decode hex payload and append it as a structured JSON line to command.txt
+    on the USB (batched inside bulk_setpoints_update()).
     Supports specific keywords like:
     - FORCE_PUMP_OFF
     - SET_PUMP_ON=0.2
@@ -226,31 +540,30 @@ def write_command_from_downlink(hex_payload):
     """
     try:
         command_str = bytes.fromhex(hex_payload).decode('utf-8').strip()
-        print(f"[USB] Decoded downlink command: {command_str}")
+        log.info("[USB] Decoded downlink command: %s", command_str)
 
-        command_data = {}
-
-        if command_str == "FORCE_PUMP_OFF" or command_str == "ZERO_LEVEL":
+        if command_str in _ATOMIC_COMMANDS:
             command_data = {"command": command_str}
+        elif (m := _KV_COMMAND_RE.match(command_str)):
+            command_data = {"command": m.group(1), "value": float(m.group(2))}
         elif "=" in command_str:
-            key, value = command_str.split("=", 1)
-            try:
-                command_data = {"command": key, "value": float(value)}
-            except ValueError:
-                print(f"[USB] Invalid numeric value in command: {command_str}")
-                return
+            log.warning("[USB] Invalid numeric value in command: %s", command_str)
+            return
         else:
-            print(f"[USB] Unsupported command format: {command_str}")
+            log.warning("[USB] Unsupported command format: %s", command_str)
             return
 
-        command_data["timestamp"] = datetime.now().isoformat(timespec="seconds")
-        with open(COMMAND_FILE, 'w') as f:
-            json.dump(command_data, f)
-            f.write('\n')
+        if not _usb_available():
+            log.warning("[USB] USB not mounted; cannot write command: %s", command_str)
+            return
 
-        print(f"[USB] Wrote command to {COMMAND_FILE}: {command_data}")
+        command_data["timestamp"] = datetime.now().isoformat(timespec="seconds")
+        _pending_commands.append(command_data)
+        log.info("[USB] Queued command for %s: %s", COMMAND_FILE, command_data)
+        if not _bulk_depth:
+            flush_commands()
     except Exception as e:
-        print(f"[USB] Failed to write command: {e}")
+        log.error("[USB] Failed to write command: %s", e)
 
 
 def handle_rak_downlink(hex_payload):
@@ -259,8 +572,8 @@ def handle_rak_downlink(hex_payload):
     :param hex_payload: Hex string of the payload (e.g., "53544f50" for "STOP")
     """
     if not hex_payload:
-        print("[RAK] No downlink payload received.")
+        log.debug("[RAK] No downlink payload received.")
         return
 
-    print(f"[RAK] Handling downlink payload: {hex_payload}")
+    log.info("[RAK] Handling downlink payload: %s", hex_payload)
     write_command_from_downlink(hex_payload)